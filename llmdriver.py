@@ -9,6 +9,7 @@ import datetime
 import logging
 import socket
 import math
+import random
 import re
 import concurrent.futures
 import functools
@@ -23,7 +24,7 @@ from prompts import build_system_prompt, get_summary_prompt
 from client_setup import setup_llm_client, parse_mode_arg, MODES
 from benchmark import Benchmark
 from client_setup import DEFAULT_MODE, ONE_IMAGE_PER_PROMPT, REASONING_ENABLED, USES_DEFAULT_TEMPERATURE, REASONING_EFFORT, IMAGE_DETAIL, USES_MAX_COMPLETION_TOKENS, MAX_TOKENS, TEMPERATURE, MINIMAP_ENABLED, MINIMAP_2D, SYSTEM_PROMPT_UNSUPPORTED
-from pyAIAgent.llm.zai_mcp_client import create_zai_vision_client
+from pyAIAgent.llm.zai_mcp_client import create_zai_vision_client, is_vision_analysis, MIN_VISION_ANALYSIS_CHARS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 log = logging.getLogger('llmdriver')
@@ -42,6 +43,13 @@ else:
 
 CLEANUP_WINDOW = 10 # Sometimes 4 is a good choice for local
 
+VISION_RETRY_BASE_DELAY = 2  # seconds before the first vision retry
+VISION_RETRY_MAX_DELAY = 16  # cap for the doubling delay
+
+def _exp_backoff(count: int, base: int = VISION_RETRY_BASE_DELAY, cap: int = VISION_RETRY_MAX_DELAY) -> int:
+    """Delay before retry number `count` (1-based): base doubled per retry, capped"""
+    return min(base << min(count - 1, 3), cap)
+
 SCREENSHOT_PATH = "latest.png"
 MINIMAP_PATH = "minimap.png"
 
@@ -236,7 +244,6 @@ def llm_stream_action(state_data: dict, timeout: float = STREAM_TIMEOUT, benchma
     # Handle Z.AI vision processing using MCP server with retry mechanism
     vision_analysis = ""
     max_vision_retries = 3
-    vision_retry_delay = 2  # seconds
 
     if CURRENT_MODE == "ZAI" and screenshot_path and os.path.exists(screenshot_path) and zai_vision_client:
         # Check if MCP server process is still alive
@@ -257,7 +264,9 @@ def llm_stream_action(state_data: dict, timeout: float = STREAM_TIMEOUT, benchma
         # Retry vision analysis multiple times
         for attempt in range(max_vision_retries):
             if attempt > 0:
-                log.info(f"Vision retry attempt {attempt + 1}/{max_vision_retries} (waiting {vision_retry_delay}s first)...")
+                # Jittered so a struggling server is not hit in lockstep
+                vision_retry_delay = _exp_backoff(attempt) * random.uniform(0.5, 1.5)
+                log.info(f"Vision retry attempt {attempt + 1}/{max_vision_retries} (waiting {vision_retry_delay:.1f}s first)...")
                 time.sleep(vision_retry_delay)
 
             try:
@@ -281,22 +290,11 @@ def llm_stream_action(state_data: dict, timeout: float = STREAM_TIMEOUT, benchma
                     log.warning("Z.AI vision client doesn't have analyze_image method")
 
                 # Validate the vision result
-                if vision_result and len(vision_result.strip()) > 50:  # Minimum reasonable length
+                if vision_result and len(vision_result.strip()) > MIN_VISION_ANALYSIS_CHARS:  # Minimum reasonable length
                     vision_result = vision_result.strip()
                     # Additional validation: check if it looks like actual analysis vs tools list
-                    invalid_indicators = [
-                        '"name": "analyze_image"',
-                        '"name": "analyze_video"',
-                        '"description": "Analyze an image',
-                        '"inputSchema"',
-                        'tools": [',
-                        '["name", "description"]'
-                    ]
-
-                    # Check if response contains MCP server metadata (wrong format)
-                    is_invalid_response = any(indicator in vision_result[:500] for indicator in invalid_indicators)
-
-                    if is_invalid_response:
+                    # (the same rule the vision client uses to decide what it caches)
+                    if not is_vision_analysis(vision_result):
                         log.warning(f"Vision analysis attempt {attempt + 1} returned MCP metadata instead of analysis")
                         log.warning(f"Response preview: {vision_result[:200]}...")
                         continue  # Try again
@@ -325,10 +323,6 @@ def llm_stream_action(state_data: dict, timeout: float = STREAM_TIMEOUT, benchma
                     log.error("CRITICAL: Unable to get vision analysis after multiple attempts. Agent cannot play without visual input.")
                     return None, None, False
 
-                # Brief delay before retry (except on last attempt)
-                if attempt < max_vision_retries - 1:
-                    time.sleep(1)
-
     # Build the user message with text and images
     image_parts_for_api = []
 
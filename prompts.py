@@ -1,14 +1,15 @@
 def build_system_prompt(actionSummary: str = "", benchmarkInstruction: str = "") -> str:
-    """Constructs the system prompt for the LLM, including the chat history summary."""
+    """Constructs the system prompt for the LLM, including the chat history summary.
+
+    The static rules come first and the per-run fields (summary, benchmark
+    instructions) last so the prompt prefix stays byte-identical across turns
+    and can be served from the provider's prefix cache.
+    """
     return f"""
         You are an AI agent designed to play Pokémon Red. Your task is to analyze the game state, plan your actions, and provide input commands to progress through the game.
 
-        Your previous actions summary: {actionSummary}
-
         General Instructions:
 
-        {benchmarkInstruction}
-        
         - Speak in the first person as if you were the player.
         - PRIORITIZE the structured game state data (position, map_id, map_name) for accurate information about your location and surroundings.
         - When vision analysis is available, use it for specific details that complement the game state: readable text on screen, visible UI elements, or immediate obstacles.
@@ -127,6 +128,11 @@ def build_system_prompt(actionSummary: str = "", benchmarkInstruction: str = "")
         - USE YOUR PREVIOUS ACTIONS TO HELP AVOID GETTING STUCK IN A LOOP.
         - If your actions yield no change in position, try a different approach or use a touch command to navigate.
 
+        ## CONTEXT
+        Your previous actions summary: {actionSummary}
+
+        {benchmarkInstruction}
+
         Now, analyze the game state and decide on your next action. Your final output should consist only of the JSON object with the action and should not duplicate or rehash any of the work you did in the thinking block.
 
         Here is the current game state:
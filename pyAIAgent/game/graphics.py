@@ -1,12 +1,21 @@
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
+import logging
+import os
 import sys
 from pyAIAgent.game.rom import (
+    load_rom,
     load_map,
     load_tileset_header,
     load_collision_data,
-    load_block_data,
+    load_block_data_cached,
 )
 
+log = logging.getLogger(__name__)
+
+# Set POKELLM_DEBUG=1 to get per-quadrant tile dumps without passing debug_tiles.
+DEBUG_TILES = os.getenv("POKELLM_DEBUG") == "1"
+
 SPECIAL_FEATURE_TILE_IDS = {
     0x04, 0x05, 0x0C, 0x0D, 0x14, 0x15, 0x1C, 0x1D, 0x64, 0x65, 0x6C, 0x6D,
     0x66, 0x67, 0x6E, 0x6F, 0x7B, 0x5A, 0x5B, 0x5C, 0x5D, 0x30, 0x31, 0x32,
@@ -14,6 +23,34 @@ SPECIAL_FEATURE_TILE_IDS = {
     0x0B, 0x1A, 0x1B,
 }
 
+# Block-local tile indices (0..15) covering each 2x2 quadrant, indexed [qy][qx].
+QUADRANT_TILE_INDICES = tuple(
+    tuple(
+        tuple((qy * 2 + r) * 4 + (qx * 2 + c) for r in range(2) for c in range(2))
+        for qx in range(2)
+    )
+    for qy in range(2)
+)
+
+# bytes.translate table turning a row of walkability bools into 'B'/'W' chars.
+WALKABILITY_CHAR_TABLE = bytes.maketrans(b'\x00\x01', b'BW')
+
+MINIMAL_MAP_COLORS = {
+    'walk': (255, 255, 255),
+    'block': (0, 0, 0),
+    'special': (255, 165, 0),
+    'marker': (0, 0, 255),
+    'grid': (100, 100, 100),
+    'debug_text': (0, 0, 255),
+}
+
+@lru_cache(maxsize=8)
+def _load_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except Exception:
+        return ImageFont.load_default()
+
 def decode_tile(tile_bytes):
     if len(tile_bytes) < 16:
         tile_bytes += b'\x00' * (16 - len(tile_bytes))
@@ -27,34 +64,97 @@ def decode_tile(tile_bytes):
 def build_quadrant_walkability(width, height, map_data, blocks, walkable_tiles):
     cols, rows = width * 2, height * 2
     grid = [[False] * cols for _ in range(rows)]
+    # Quadrant walkability depends only on the block, so resolve it once per
+    # block (top-left, top-right, bottom-left, bottom-right) rather than per cell.
+    block_quads = [
+        (b[4] in walkable_tiles, b[6] in walkable_tiles, b[12] in walkable_tiles, b[14] in walkable_tiles)
+        if len(b) >= 16 else None
+        for b in blocks
+    ]
+    num_blocks = len(block_quads)
+    map_len = len(map_data)
+    for by in range(height):
+        top, bottom = grid[by * 2], grid[by * 2 + 1]
+        row_start = by * width
+        for bx in range(min(width, map_len - row_start)):
+            bidx = map_data[row_start + bx]
+            if bidx >= num_blocks:
+                continue
+            quads = block_quads[bidx]
+            if quads is None:
+                continue
+            gx = bx * 2
+            top[gx], top[gx + 1], bottom[gx], bottom[gx + 1] = quads
+    return grid
+
+def build_walkability_buffer(width, height, map_data, blocks, walkable_tiles):
+    """
+    Same walkability as build_quadrant_walkability, as one flat buffer of 0/1
+    bytes indexed by y * (width * 2) + x, without the per-cell Python bools.
+    """
+    cols = width * 2
+    walkable = bytearray(cols * height * 2)
+    # Each block contributes two cells to the top row and two to the bottom.
+    block_rows = [
+        (bytes((b[4] in walkable_tiles, b[6] in walkable_tiles)),
+         bytes((b[12] in walkable_tiles, b[14] in walkable_tiles)))
+        if len(b) >= 16 else None
+        for b in blocks
+    ]
+    num_blocks = len(block_rows)
+    map_len = len(map_data)
+    for by in range(height):
+        top = by * 2 * cols
+        bottom = top + cols
+        row_start = by * width
+        for bx in range(min(width, map_len - row_start)):
+            bidx = map_data[row_start + bx]
+            if bidx >= num_blocks:
+                continue
+            quads = block_rows[bidx]
+            if quads is None:
+                continue
+            gx = bx * 2
+            walkable[top + gx:top + gx + 2], walkable[bottom + gx:bottom + gx + 2] = quads
+    return walkable
+
+def calculate_walkable_special_quadrants(width, height, map_data, blocks, grid_data, debug_tiles=False):
+    if debug_tiles or DEBUG_TILES:
+        return _calculate_walkable_special_quadrants_debug(width, height, map_data, blocks, grid_data)
+    special_quadrants = set()
+    if not grid_data or not grid_data[0]:
+        return special_quadrants
+    grid_h, grid_w = len(grid_data), len(grid_data[0])
+
     for by in range(height):
         for bx in range(width):
             map_idx = by * width + bx
-            if map_idx >= len(map_data):
-                continue
-            bidx = map_data[map_idx]
-            if bidx >= len(blocks):
+            if map_idx >= len(map_data) or map_data[map_idx] >= len(blocks):
                 continue
-            subtiles = blocks[bidx]
-            if len(subtiles) < 16:
+            block_def = blocks[map_data[map_idx]]
+            if len(block_def) < 16:
                 continue
-            for qr in range(2):
-                for qc in range(2):
-                    col_idx = (qr * 2 + 1) * 4 + (qc * 2 + 0)
-                    if col_idx >= len(subtiles):
+
+            for gqy in range(2):
+                gy = by * 2 + gqy
+                if gy >= grid_h:
+                    continue
+                for gqx in range(2):
+                    gx = bx * 2 + gqx
+                    if gx >= grid_w or not grid_data[gy][gx]:
                         continue
-                    gy, gx = by * 2 + qr, bx * 2 + qc
-                    if 0 <= gy < rows and 0 <= gx < cols:
-                        grid[gy][gx] = (subtiles[col_idx] in walkable_tiles)
-    return grid
+                    if all(block_def[i] in SPECIAL_FEATURE_TILE_IDS for i in QUADRANT_TILE_INDICES[gqy][gqx]):
+                        special_quadrants.add((gx, gy))
 
-def calculate_walkable_special_quadrants(width, height, map_data, blocks, grid_data, debug_tiles=False):
+    return special_quadrants
+
+def _calculate_walkable_special_quadrants_debug(width, height, map_data, blocks, grid_data):
+    """Same scan as calculate_walkable_special_quadrants, printing every quadrant's tile IDs."""
     special_quadrants = set()
     if not grid_data or not grid_data[0]:
         return special_quadrants
     grid_h, grid_w = len(grid_data), len(grid_data[0])
-    if debug_tiles:
-        print("Scanning for WALKABLE special quadrants & tile IDs...", file=sys.stderr)
+    print("Scanning for WALKABLE special quadrants & tile IDs...", file=sys.stderr)
 
     for by in range(height):
         for bx in range(width):
@@ -81,22 +181,20 @@ def calculate_walkable_special_quadrants(width, height, map_data, blocks, grid_d
                         and None not in tile_ids
                     )
 
-                    if debug_tiles:
-                        tiles_str = ", ".join(
-                            [f"0x{tid:02X}" if tid is not None else "N/A" for tid in tile_ids]
-                        )
-                        walk_str = "Walkable" if is_walkable else "Blocked"
-                        special_str = (
-                            "Special"
-                            if is_special
-                            else ("Partial" if any(tid in SPECIAL_FEATURE_TILE_IDS for tid in tile_ids if tid is not None) else "Normal")
-                        )
-                        print(f"DEBUG: ({gx:>2},{gy:>2}) Blk({bx},{by}) ID 0x{bidx:02X} -> [{tiles_str}] ({walk_str}, {special_str})", file=sys.stderr)
+                    tiles_str = ", ".join(
+                        [f"0x{tid:02X}" if tid is not None else "N/A" for tid in tile_ids]
+                    )
+                    walk_str = "Walkable" if is_walkable else "Blocked"
+                    special_str = (
+                        "Special"
+                        if is_special
+                        else ("Partial" if any(tid in SPECIAL_FEATURE_TILE_IDS for tid in tile_ids if tid is not None) else "Normal")
+                    )
+                    print(f"DEBUG: ({gx:>2},{gy:>2}) Blk({bx},{by}) ID 0x{bidx:02X} -> [{tiles_str}] ({walk_str}, {special_str})", file=sys.stderr)
 
                     if is_special and is_walkable:
                         special_quadrants.add((gx, gy))
-                        if debug_tiles:
-                            print(f"DEBUG: -> Added ({gx},{gy})", file=sys.stderr)
+                        print(f"DEBUG: -> Added ({gx},{gy})", file=sys.stderr)
 
     return special_quadrants
 
@@ -117,11 +215,11 @@ def dump_minimal_map(rom_path, map_id, pos=None, grid_lines=False, debug_coords=
         PIL.Image.Image or None: The generated (and possibly cropped) image.
     """
     try:
-        rom = open(rom_path, 'rb').read()
+        rom = load_rom(rom_path)
         tileset_id, width, height, map_data = load_map(rom, map_id)
         bank, blocks_ptr, _, collision_ptr, _ = load_tileset_header(rom, tileset_id)
         walkable_tiles = load_collision_data(rom, collision_ptr, bank)
-        blocks = load_block_data(rom, blocks_ptr, bank, map_data)
+        blocks = load_block_data_cached(rom_path, rom, blocks_ptr, bank, map_data)
         grid_data = build_quadrant_walkability(width, height, map_data, blocks, walkable_tiles)
         if not grid_data or not grid_data[0]:
             raise ValueError("Failed to build walkability grid.")
@@ -139,21 +237,11 @@ def dump_minimal_map(rom_path, map_id, pos=None, grid_lines=False, debug_coords=
         img = Image.new('RGB', (img_w, img_h))
         draw = ImageDraw.Draw(img)
 
-        colors = {
-            'walk': (255, 255, 255),
-            'block': (0, 0, 0),
-            'special': (255, 165, 0),
-            'marker': (0, 0, 255),
-            'grid': (100, 100, 100),
-            'debug_text': (0, 0, 255),
-        }
+        colors = MINIMAL_MAP_COLORS
 
         font = None
         if debug_coords:
-            try:
-                font = ImageFont.load_default(size=max(8, min(12, cell_size // 2 - 2)))
-            except Exception:
-                font = ImageFont.load_default()
+            font = _load_font(max(8, min(12, cell_size // 2 - 2)))
 
         # Draw walkability & special
         for y in range(grid_h):
@@ -223,11 +311,11 @@ def dump_minimal_map(rom_path, map_id, pos=None, grid_lines=False, debug_coords=
                     right_px = (right + 1) * cell_size
                     bottom_px = (bottom + 1) * cell_size
 
-                    print(
-                        f"[dump_minimal_map] Cropping to grid region x[{left}:{right}] "
-                        f"y[{top}:{bottom}] -> px box ({left_px},{top_px},{right_px},{bottom_px})",
-                        file=sys.stderr
-                    )
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug(
+                            f"[dump_minimal_map] Cropping to grid region x[{left}:{right}] "
+                            f"y[{top}:{bottom}] -> px box ({left_px},{top_px},{right_px},{bottom_px})"
+                        )
                     img = img.crop((left_px, top_px, right_px, bottom_px))
                 except Exception as e:
                     print(f"Warning: Invalid `crop` in dump_minimal_map or error cropping: {e}", file=sys.stderr)
@@ -268,11 +356,11 @@ def dump_minimap_map_array(rom_path, map_id, pos=None, crop=None):
         str or None: Semicolon-separated rows string, or None on error.
     """
     try:
-        rom = open(rom_path, 'rb').read()
+        rom = load_rom(rom_path)
         tileset_id, width, height, map_data = load_map(rom, map_id)
         bank, blocks_ptr, _, collision_ptr, _ = load_tileset_header(rom, tileset_id)
         walkable_tiles = load_collision_data(rom, collision_ptr, bank)
-        blocks = load_block_data(rom, blocks_ptr, bank, map_data)
+        blocks = load_block_data_cached(rom_path, rom, blocks_ptr, bank, map_data)
         grid_data = build_quadrant_walkability(width, height, map_data, blocks, walkable_tiles)
         if not grid_data or not grid_data[0]:
             raise ValueError("Failed to build walkability grid.")
@@ -310,25 +398,20 @@ def dump_minimap_map_array(rom_path, map_id, pos=None, crop=None):
         else:
             left, right, top, bottom = 0, grid_w - 1, 0, grid_h - 1
 
-        rows = []
-        for y in range(top, bottom + 1):
-            row_chars = []
-            for x in range(left, right + 1):
-                # Player marker takes precedence
-                if pos and x == pos[0] and y == pos[1]:
-                    row_chars.append('P')
-                else:
-                    is_special = (x, y) in walkable_special
-                    is_walkable = grid_data[y][x]
-                    if is_special:
-                        row_chars.append('O')
-                    elif is_walkable:
-                        row_chars.append('W')
-                    else:
-                        row_chars.append('B')
-                # (Debug: could print tile IDs if desired, but omitted here)
-            rows.append("".join(row_chars))
-
+        # Walkability maps straight to B/W with one translate per row; the sparse
+        # special quadrants and the player marker are patched in afterwards.
+        rows = [
+            bytearray(bytes(grid_data[y][left:right + 1]).translate(WALKABILITY_CHAR_TABLE))
+            for y in range(top, bottom + 1)
+        ]
+        for x, y in walkable_special:
+            if left <= x <= right and top <= y <= bottom:
+                rows[y - top][x - left] = ord('O')
+        # Player marker takes precedence
+        if pos and left <= pos[0] <= right and top <= pos[1] <= bottom:
+            rows[pos[1] - top][pos[0] - left] = ord('P')
+
+        rows = [row.decode('ascii') for row in rows]
         return ";".join(rows)
 
     except (FileNotFoundError, IOError) as e:
@@ -1,4 +1,24 @@
+import os
+import mmap
 import sys
+from functools import lru_cache
+
+DEFAULT_ROM = 'red.gb'
+
+@lru_cache(maxsize=None)
+def get_rom_path():
+    """Get ROM path from environment variable or default, relative to roms folder (fixed for the run)"""
+    rom_name = os.getenv('POKEMON_ROM', DEFAULT_ROM)
+    # If ROM path doesn't include a directory, assume it's in roms folder
+    if os.path.sep not in rom_name and not os.path.isabs(rom_name):
+        return os.path.join('roms', rom_name)
+    return rom_name
+
+@lru_cache(maxsize=4)
+def load_rom(rom_path):
+    """Returns a read-only mmap of the ROM, shared by every caller for the session."""
+    with open(rom_path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
 def read_u8(data, offset):
     if offset < 0 or offset >= len(data):
@@ -80,6 +100,22 @@ def load_block_data(rom, blocks_ptr, bank, map_data):
         print(f"Warning: Block data truncated ({count}/{req_count}).", file=sys.stderr)
     return [rom[blk_off + i * 16: blk_off + i * 16 + 16].ljust(16, b'\x00') for i in range(count)]
 
+# Decoded block tables keyed by (rom_path, bank, blocks_ptr). Maps that share a
+# tileset share a table, so this only grows when a map uses a higher block index.
+_block_table_cache = {}
+
+def load_block_data_cached(rom_path, rom, blocks_ptr, bank, map_data):
+    """load_block_data, reusing the block table already decoded for this tileset."""
+    key = (rom_path, bank, blocks_ptr)
+    table = _block_table_cache.get(key)
+    req_count = (max(map_data) if map_data else 0) + 1
+    if table is None or len(table) < req_count:
+        fresh = load_block_data(rom, blocks_ptr, bank, map_data)
+        if table is None or len(fresh) > len(table):
+            table = fresh
+            _block_table_cache[key] = table
+    return table
+
 def load_tile_graphics(rom, tiles_ptr, bank, blocks, walkable_tiles):
     tile_off = gb_to_file_offset(tiles_ptr, bank)
     if tile_off >= len(rom):
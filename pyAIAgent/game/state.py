@@ -1,22 +1,18 @@
-import os
 import struct
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pyAIAgent.game.graphics import dump_minimal_map, dump_minimap_map_array
 from pyAIAgent.utils.socket_utils import readrange, send_command, _flush_socket
 from pyAIAgent.utils.image_utils import capture
 from pyAIAgent.game.data import get_species_map, get_location_name, decode_pokemon_text
+from pyAIAgent.game.rom import get_rom_path
 
-DEFAULT_ROM = 'red.gb'
-
-def get_rom_path():
-    """Get ROM path from environment variable or default, relative to roms folder"""
-    rom_name = os.getenv('POKEMON_ROM', DEFAULT_ROM)
-    # If ROM path doesn't include a directory, assume it's in roms folder
-    if os.path.sep not in rom_name and not os.path.isabs(rom_name):
-        return os.path.join('roms', rom_name)
-    return rom_name
 MINI_MAP_SIZE = (21,21)
 
+# Minimap rendering is ROM/CPU work with no socket access, so it runs here while
+# the main thread does the (shared, strictly sequential) mGBA socket reads.
+_render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="minimap")
+
 def get_state(sock) -> str:
     _flush_socket(sock)
     return send_command(sock, "state")
@@ -107,6 +103,21 @@ def get_location(sock) -> tuple[int, int, int, str] | None:
     return (mid, tile_x, tile_y, facing, mapName)
 
 
+def _render_minimap(rom_path, mid, pos) -> str:
+    """Saves minimap.png for the current map and returns the 2D minimap string."""
+    dump_minimal_map(rom_path, mid, pos, grid_lines=True, crop=MINI_MAP_SIZE).save("minimap.png")
+    return dump_minimap_map_array(rom_path, mid, pos, crop=MINI_MAP_SIZE)
+
+
+def _render_default_minimap() -> str:
+    # no map data or in battle → create default white minimap
+    from PIL import Image
+    # Create a white square with same dimensions as typical minimap
+    default_minimap = Image.new('RGB', (160, 160), color='white')
+    default_minimap.save("minimap.png")
+    return ""
+
+
 def prep_llm(sock) -> dict:
     _flush_socket(sock)
     capture(sock, "latest.png")
@@ -115,27 +126,24 @@ def prep_llm(sock) -> dict:
     loc = get_location(sock)
     mid = None
     mapName = None
-    map2D = ""
 
     if loc:
         mid, x, y, facing, mapName = loc
-        rom_path = get_rom_path()
-        dump_minimal_map(rom_path, mid, (x, y), grid_lines=True, crop=MINI_MAP_SIZE).save("minimap.png")
-        map2D = dump_minimap_map_array(rom_path, mid, (x, y), crop=MINI_MAP_SIZE)
+        render = _render_pool.submit(_render_minimap, get_rom_path(), mid, (x, y))
         position = (x, y)
     else:
-        # no map data or in battle → create default white minimap
-        from PIL import Image
-        # Create a white square with same dimensions as typical minimap
-        default_minimap = Image.new('RGB', (160, 160), color='white')
-        default_minimap.save("minimap.png")
+        render = _render_pool.submit(_render_default_minimap)
         position = None
         facing = None
 
+    party = get_party_text(sock)
+    badges = get_badges_text(sock)
+    map2D = render.result()
+
     return {
-        "party":   get_party_text(sock),
+        "party":   party,
         "map_id": mid,
-        "badges":  get_badges_text(sock),
+        "badges":  badges,
         "position": position,
         "facing":  facing,
         "map_name": mapName,
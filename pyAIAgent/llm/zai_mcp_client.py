@@ -4,18 +4,171 @@ Provides vision capabilities through Z.AI's MCP server for image understanding
 """
 
 import os
-import json
+import re
+import sys
+import base64
+import hashlib
+import mmap
+import atexit
 import logging
+import shutil
+import signal
+import itertools
+import threading
 import subprocess
 import asyncio
+import concurrent.futures
+import orjson
+from collections import OrderedDict, deque
 from typing import Optional, Dict, Any, List
 from pathlib import Path
 
+if sys.version_info >= (3, 11):
+    from asyncio import timeout as async_timeout
+else:
+    from async_timeout import timeout as async_timeout
+
 log = logging.getLogger('zai_mcp_client')
 
+# One MCP server per (api_key, mode) for the whole process; spawning npx costs seconds.
+_mcp_clients: Dict[tuple, "ZAIMCPClient"] = {}
+
+# Phrases that only appear when the server echoes its tool descriptions instead of an analysis
+_TOOL_KEYWORD_RE = re.compile(
+    "|".join(re.escape(k) for k in (
+        'analyze_image', 'analyze_video', 'inputSchema', 'maximum file size',
+        'supports both local files and remote URL'
+    )),
+    re.IGNORECASE
+)
+
+# Built once at import (after .env has been loaded by client_setup); restarts only overlay the key/mode
+_MCP_CMD = (shutil.which('npx') or 'npx', '-y', '@z_ai/mcp-server')  # resolved path skips the PATH/PATHEXT search per spawn
+_BASE_ENV = os.environ.copy()
+
+FALLBACK_MAX_SIDE = 512  # the fallback requests detail=low, so larger images are downsampled server-side anyway
+ANALYSIS_CACHE_SIZE = 256  # distinct (frame, prompt) analyses remembered per client
+DATA_URL_CACHE_SIZE = 4  # encoded screenshots kept for retries of the same frame
+MIN_VISION_ANALYSIS_CHARS = 50  # shorter answers are rejected (and retried) by llm_stream_action
+
+# Substrings that, near the start of an answer, mean the server sent MCP metadata
+# (its tool list or schema) instead of an analysis
+_MCP_METADATA_INDICATORS = (
+    '"name": "analyze_image"',
+    '"name": "analyze_video"',
+    '"description": "Analyze an image',
+    '"inputSchema"',
+    'tools": [',
+    '["name", "description"]'
+)
+
+MCP_VISION_TOOL = "analyze_image"
+
+MCP_PROTOCOL_VERSION = "2024-11-05"
+MCP_PIPE_SIZE = 1 << 20  # several pipelined requests in one write can outgrow the 64 KB default pipe
+MCP_STARTUP_TIMEOUT = 30.0  # seconds; a cold `npx -y` may need to download the package
+
+# Fixed startup messages, pre-serialized once as wire lines (id 0 is reserved for initialize)
+_INITIALIZE_REQUEST = orjson.dumps({
+    "jsonrpc": "2.0",
+    "id": 0,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": MCP_PROTOCOL_VERSION,
+        "capabilities": {},
+        "clientInfo": {"name": "pokemon-llm", "version": "1.0"}
+    }
+}, option=orjson.OPT_APPEND_NEWLINE)
+_INITIALIZED_NOTIFICATION = orjson.dumps(
+    {"jsonrpc": "2.0", "method": "notifications/initialized"}, option=orjson.OPT_APPEND_NEWLINE)
+
+def _vision_call_params(image_path: str, prompt: str) -> Dict[str, Any]:
+    """tools/call params for the vision tool (parameter names from the server's schema)"""
+    # A fresh dict per call: requests are pipelined, so a shared mutable template would race
+    return {"name": MCP_VISION_TOOL, "arguments": {"image_source": image_path, "prompt": prompt}}
+
+def _image_digest(image_path: str) -> bytes:
+    """Content hash of an image file, used to recognise a frame we have already analyzed"""
+    with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return hashlib.blake2b(mm, digest_size=16).digest()
+
+def _screenshot_digest(image_path: str) -> Optional[bytes]:
+    """_image_digest, or None (logged) when the screenshot is missing or empty (mmap rejects empty files)"""
+    try:
+        return _image_digest(image_path)
+    except FileNotFoundError:
+        log.error(f"Screenshot missing: {image_path}")
+    except ValueError:
+        log.error(f"Screenshot is empty (not written yet?): {image_path}")
+    return None
+
+def is_vision_analysis(analysis) -> bool:
+    """
+    Whether a vision answer is usable: long enough and not MCP metadata. The driver
+    accepts exactly these, and only these are cached; anything else is re-asked on retry.
+    """
+    if not isinstance(analysis, str):
+        return False
+    analysis = analysis.strip()
+    if len(analysis) <= MIN_VISION_ANALYSIS_CHARS:
+        return False
+    head = analysis[:500]
+    return not any(indicator in head for indicator in _MCP_METADATA_INDICATORS)
+
+class _LRUCache:
+    """Small thread-safe LRU keyed by tuples (analyses, encoded images)"""
+
+    __slots__ = ('_entries', '_maxsize', '_lock')
+
+    def __init__(self, maxsize: int = ANALYSIS_CACHE_SIZE):
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: tuple, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+def _image_data_url(image_path: str, max_side: Optional[int] = None) -> str:
+    """
+    Read an image and return it as a base64 data URL, typed by its magic bytes.
+    Images longer than max_side are shrunk and re-encoded as JPEG first.
+    """
+    if max_side is not None:
+        from PIL import Image
+        with Image.open(image_path) as img:
+            if max(img.size) > max_side:
+                import io
+                img.thumbnail((max_side, max_side))
+                buf = io.BytesIO()
+                img.convert("RGB").save(buf, "JPEG", quality=80, optimize=True)
+                return (b"data:image/jpeg;base64," + base64.b64encode(buf.getbuffer())).decode('ascii')
+
+    # Map the file and encode straight from the mapping: no Python bytes copy of the raw image
+    with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mime = b"image/jpeg" if mm[:2] == b"\xff\xd8" else b"image/png"
+        b64 = base64.b64encode(memoryview(mm))
+    # Build the URL as bytes and decode once: no intermediate str copy of the payload
+    return (b"data:" + mime + b";base64," + b64).decode('ascii')
+
 class ZAIMCPClient:
     """Client for interacting with Z.AI's MCP Vision Server"""
 
+    __slots__ = (
+        'api_key', 'mode', 'mcp_process', 'is_connected', '_cache',
+        '_pending', '_pending_lock', '_write_lock', '_next_id', '_inflight', '_inflight_lock', '_stderr_tail', '_stderr_thread'
+    )
+
     def __init__(self, api_key: str, mode: str = "ZAI"):
         """
         Initialize the Z.AI MCP Client
@@ -28,104 +181,229 @@ class ZAIMCPClient:
         self.mode = mode
         self.mcp_process = None
         self.is_connected = False
+        self._cache = _LRUCache()
+
+        # Responses are demultiplexed by JSON-RPC id so several calls can share the pipe
+        self._pending: Dict[int, concurrent.futures.Future] = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._next_id = itertools.count(1)  # 0 is used by initialize
+        # (image digest, prompt) -> (id, future) of the request already on the wire for it
+        self._inflight: Dict[tuple, tuple] = {}
+        self._inflight_lock = threading.Lock()
+        self._stderr_tail: deque = deque(maxlen=200)
+        self._stderr_thread: Optional[threading.Thread] = None
 
         log.info("Z.AI MCP Client initialized")
 
         # Start the MCP server synchronously
         self._start_mcp_server_sync()
 
-    async def start_mcp_server(self) -> bool:
-        """
-        Start the Z.AI MCP vision server
-
-        Returns:
-            True if server started successfully, False otherwise
-        """
-        try:
-            # Set up environment variables for MCP server
-            env = os.environ.copy()
-            env['Z_AI_API_KEY'] = self.api_key
-            env['Z_AI_MODE'] = self.mode
-
-            # Start MCP server using npx
-            cmd = [
-                'npx', '-y', '@z_ai/mcp-server'
-            ]
-
-            log.info("Starting Z.AI MCP vision server...")
-
-            # Start the subprocess
-            self.mcp_process = await asyncio.create_subprocess_exec(
-                *cmd,
-                env=env,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            # Give it a moment to start
-            await asyncio.sleep(2)
-
-            # Check if process is still running
-            if self.mcp_process.returncode is None:
-                self.is_connected = True
-                log.info("Z.AI MCP vision server started successfully")
-                return True
-            else:
-                log.error(f"MCP server exited with code: {self.mcp_process.returncode}")
-                return False
-
-        except Exception as e:
-            log.error(f"Failed to start Z.AI MCP server: {e}", exc_info=True)
-            return False
-
     def _start_mcp_server_sync(self):
         """Start the MCP server synchronously"""
         try:
-            import subprocess
-            import time
-
             # Set up environment variables for MCP server
-            env = os.environ.copy()
-            env['Z_AI_API_KEY'] = self.api_key
-            env['Z_AI_MODE'] = self.mode
+            env = {**_BASE_ENV, 'Z_AI_API_KEY': self.api_key, 'Z_AI_MODE': self.mode}
 
             # Start MCP server using npx
-            cmd = [
-                'npx', '-y', '@z_ai/mcp-server'
-            ]
+            cmd = list(_MCP_CMD)
 
             log.info("Starting Z.AI MCP vision server...")
             log.info(f"Command: {' '.join(cmd)}")
             log.info(f"Environment variables: Z_AI_API_KEY={'*' * len(self.api_key)}, Z_AI_MODE={self.mode}")
 
-            # Start the subprocess
+            self.is_connected = False
+
+            # A restart replaces any previous server; once it and its children have
+            # exited, that server's reader and stderr threads see EOF and finish
+            if self.mcp_process is not None:
+                self.stop_mcp_server_sync()
+
+            # Start the subprocess in its own session so stopping it can signal the
+            # node processes npx spawns too (they hold the same pipes)
             self.mcp_process = subprocess.Popen(
                 cmd,
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 env=env,
-                text=False  # Use bytes mode for proper MCP communication
+                text=False,  # Use bytes mode for proper MCP communication
+                bufsize=MCP_PIPE_SIZE,
+                start_new_session=True
             )
+            self._widen_pipes()
+            self._stderr_tail = deque(maxlen=200)
+            self._stderr_thread = threading.Thread(
+                target=self._drain_stderr,
+                args=(self.mcp_process, self._stderr_tail),
+                name="mcp-stderr",
+                daemon=True
+            )
+            self._stderr_thread.start()
+
+            # The reader thread handles the handshake too: it skips non-JSON lines and
+            # notifications and hands the initialize response (id 0) to this future.
+            # Waiting on it returns as soon as npx is up and fails fast on a crash.
+            # Each server gets its own pending table, so a previous server's reader
+            # reaching EOF only fails the requests that were sent to it
+            init_future = concurrent.futures.Future()
+            with self._pending_lock:
+                self._pending = {0: init_future}
+            threading.Thread(
+                target=self._read_loop,
+                args=(self.mcp_process, self._pending),
+                name="mcp-reader",
+                daemon=True
+            ).start()
+            try:
+                self._send_request(_INITIALIZE_REQUEST)
+                init_response = init_future.result(timeout=MCP_STARTUP_TIMEOUT)
+            except BrokenPipeError:
+                # Server died before reading its stdin; reported below with its stderr
+                self.mcp_process.wait(timeout=5)
+                init_response = None
+            except concurrent.futures.TimeoutError:
+                init_response = None
+            finally:
+                with self._pending_lock:
+                    self._pending.pop(0, None)
 
-            # Give it a moment to start
-            time.sleep(3)  # Increased startup time
-
-            # Check if process is still running
-            if self.mcp_process.returncode is None:
+            if init_response is not None and 'result' in init_response:
+                self._send_request(_INITIALIZED_NOTIFICATION)
                 self.is_connected = True
                 log.info("Z.AI MCP vision server started successfully")
                 log.info(f"MCP server PID: {self.mcp_process.pid}")
-            else:
+            elif self.mcp_process.poll() is not None:
                 log.error(f"MCP server exited with code: {self.mcp_process.returncode}")
-                # Read stderr to see what went wrong
-                if self.mcp_process.stderr:
-                    stderr_output = self.mcp_process.stderr.read().decode()
-                    log.error(f"MCP server stderr during startup: {stderr_output}")
+                # Show the stderr captured so far to see what went wrong
+                log.error(f"MCP server stderr during startup: {self._stderr_output()}")
+            else:
+                log.error(f"MCP server did not complete the initialize handshake: {init_response}")
 
         except Exception as e:
             log.error(f"Failed to start Z.AI MCP server synchronously: {e}", exc_info=True)
+        finally:
+            # Never leave a live but unusable server behind: once it has exited,
+            # llm_stream_action sees poll() set and restarts it
+            if not self.is_connected and self.mcp_process is not None and self.mcp_process.poll() is None:
+                self._kill_server()
+
+    @staticmethod
+    def _drain_stderr(process: subprocess.Popen, tail: deque):
+        """Keep reading the server's stderr so a chatty server never blocks on a full pipe"""
+        with process.stderr:
+            for line in process.stderr:
+                text = line.decode(errors='replace').rstrip()
+                tail.append(text)
+                log.debug("MCP server stderr: %s", text)
+
+    def _stderr_output(self) -> str:
+        """Most recent stderr lines from the server (waits briefly for a dead server's last output)"""
+        thread = self._stderr_thread
+        if thread is None:
+            return ""
+        if self.mcp_process is not None and self.mcp_process.poll() is not None:
+            thread.join(timeout=1.0)
+        return "\n".join(self._stderr_tail)
+
+    def _widen_pipes(self):
+        """Grow the kernel pipe buffers to MCP_PIPE_SIZE where the OS allows it (Linux)"""
+        if sys.platform != "linux":
+            return
+        import fcntl
+        F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+        for pipe in (self.mcp_process.stdin, self.mcp_process.stdout):
+            try:
+                fcntl.fcntl(pipe.fileno(), F_SETPIPE_SZ, MCP_PIPE_SIZE)
+            except OSError as e:
+                # Unprivileged processes are capped by /proc/sys/fs/pipe-max-size
+                log.debug(f"Could not widen MCP pipe: {e}")
+                return
+
+    def _send_request(self, request):
+        """Write newline-delimited JSON-RPC: one message dict, or pre-serialized line(s)"""
+        payload = request if isinstance(request, bytes) else orjson.dumps(request, option=orjson.OPT_APPEND_NEWLINE)
+        # Straight to the pipe fd: one write syscall per message, no buffer copy or flush
+        view = memoryview(payload)
+        fd = self.mcp_process.stdin.fileno()
+        with self._write_lock:
+            while view:
+                view = view[os.write(fd, view):]
+
+    def _read_loop(self, process: subprocess.Popen, pending: Dict[int, concurrent.futures.Future]):
+        """Background reader for one server: hand each response to the future waiting on its id"""
+        with process.stdout:
+            for line in process.stdout:
+                try:
+                    data = orjson.loads(line)
+                except ValueError:
+                    log.warning(f"Ignoring non-JSON line from MCP server: {line[:200]!r}")
+                    continue
+                for message in (data if isinstance(data, list) else [data]):
+                    # Only responses resolve our requests: server-initiated requests and
+                    # notifications carry "method", and their ids come from the server's own counter
+                    if not isinstance(message, dict) or 'method' in message or \
+                            ('result' not in message and 'error' not in message):
+                        log.debug("Ignoring MCP message that is not a response: %s", line[:200])
+                        continue
+                    with self._pending_lock:
+                        future = pending.pop(message.get('id'), None)
+                    if future is not None:
+                        self._resolve(future, message)
+
+        # EOF: the server went away, wake up everyone still waiting on it
+        if self.mcp_process is process:
+            self.is_connected = False
+        with self._pending_lock:
+            waiting = list(pending.values())
+            pending.clear()
+        for future in waiting:
+            self._resolve(future, None)
+
+    @staticmethod
+    def _resolve(future: concurrent.futures.Future, value):
+        """Set a future's result unless its waiter already gave up and cancelled it"""
+        try:
+            future.set_result(value)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _call(self, method: str, params: Dict[str, Any]) -> tuple:
+        """Send a request and return (id, future) that resolves to its response"""
+        return self._call_batch([(method, params)])[0]
+
+    def _call_batch(self, calls: List[tuple]) -> List[tuple]:
+        """
+        Send (method, params) calls in one write and return an (id, future) per call.
+        Each call is its own newline-delimited message: the negotiated protocol
+        version (2024-11-05) does not define JSON-RPC batch arrays.
+        """
+        requests = []
+        futures = []
+        with self._pending_lock:
+            for method, params in calls:
+                request_id = next(self._next_id)
+                future = concurrent.futures.Future()
+                self._pending[request_id] = future
+                futures.append((request_id, future))
+                requests.append({
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "method": method,
+                    "params": params
+                })
+        self._send_request(b"".join(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE) for r in requests))
+        return futures
+
+    def _forget(self, request_id: int, future: concurrent.futures.Future):
+        """
+        Drop a pending request that timed out so a late reply is discarded, and
+        resolve its future with None so callers sharing it stop waiting and the
+        frame is no longer treated as in flight
+        """
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+        self._resolve(future, None)
 
     def analyze_image_sync(self, image_path: str, prompt: str = "What does this image show?") -> Optional[str]:
         """
@@ -138,19 +416,64 @@ class ZAIMCPClient:
         Returns:
             Analysis result as string, or None if failed
         """
-        # Use asyncio.run to call the async method
+        # Blocks on the reader thread's future directly: no event loop involved
+        if not self.is_connected:
+            log.error("MCP server not connected")
+            return None
+
         try:
-            return asyncio.run(self.analyze_image(image_path, prompt))
+            started = self._start_analysis(image_path, prompt)
+            if started is None:
+                return None
+            cache_key, cached, request_id, future = started
+            if cached is not None:
+                return cached
+
+            try:
+                response_data = future.result(timeout=30.0)
+            except concurrent.futures.TimeoutError:
+                self._forget(request_id, future)
+                log.error(f"MCP server response timeout for {MCP_VISION_TOOL} (id {request_id})")
+                response_data = None
+            return self._finish_analysis(cache_key, response_data)
         except Exception as e:
             log.error(f"Sync image analysis failed: {e}", exc_info=True)
             return None
 
-    async def stop_mcp_server(self):
-        """Stop the MCP server"""
+    @staticmethod
+    def _signal_server(process: subprocess.Popen, kill: bool):
+        """Signal the server's whole process group (npx runs the real server as a child)"""
+        if sys.platform == "win32":
+            (process.kill if kill else process.terminate)()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _kill_server(self):
+        """
+        Terminate the server and its children and wait for it, killing them if it
+        does not exit in time, then close our end of its stdin. Its stdout and
+        stderr are closed by the reader threads once they see EOF.
+        """
+        process = self.mcp_process
+        try:
+            self._signal_server(process, kill=False)
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            log.warning("MCP server did not terminate in time, killing it")
+            self._signal_server(process, kill=True)
+            process.wait()
+        finally:
+            with self._write_lock:
+                process.stdin.close()
+
+    def stop_mcp_server_sync(self):
+        """Stop the MCP server synchronously (also registered with atexit)"""
         if self.mcp_process:
             try:
-                self.mcp_process.terminate()
-                await self.mcp_process.wait()
+                self._kill_server()
                 log.info("Z.AI MCP vision server stopped")
             except Exception as e:
                 log.warning(f"Error stopping MCP server: {e}")
@@ -173,164 +496,216 @@ class ZAIMCPClient:
             log.error("MCP server not connected")
             return None
 
-        if not os.path.exists(image_path):
-            log.error(f"Image file not found: {image_path}")
+        try:
+            started = self._start_analysis(image_path, prompt)
+            if started is None:
+                return None
+            cache_key, cached, request_id, future = started
+            if cached is not None:
+                return cached
+
+            response_data = await self._await_response(request_id, future, MCP_VISION_TOOL)
+            return self._finish_analysis(cache_key, response_data)
+
+        except Exception as e:
+            log.error(f"Failed to analyze image: {e}", exc_info=True)
             return None
 
-        try:
-            # First, try to list available tools
-            list_tools_request = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "method": "tools/list",
-                "params": {}
-            }
+    def _start_analysis(self, image_path: str, prompt: str) -> Optional[tuple]:
+        """
+        Shared front half of analyze_image/analyze_image_sync.
+
+        Returns (cache_key, cached_analysis, request_id, future): on a cache hit only the
+        first two are set, otherwise the tools/call request has been sent. None if the
+        image is missing or empty.
+        """
+        return self._start_analyses([(image_path, prompt)])[0]
 
-            log.info(f"Requesting available tools: {json.dumps(list_tools_request, indent=2)}")
+    def _start_analyses(self, items: List[tuple]) -> List[Optional[tuple]]:
+        """
+        _start_analysis for several (image_path, prompt) items. Items not answered from
+        the cache or joined to a request already in flight go out together in one write.
+        """
+        started: List[Optional[tuple]] = []
+        for image_path, prompt in items:
+            # The same screen is often analyzed several frames in a row; hashing it
+            # also doubles as the existence check (no separate stat)
+            digest = _screenshot_digest(image_path)
+            if digest is None:
+                started.append(None)
+                continue
+            cache_key = (digest, prompt)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                log.debug("Reusing cached analysis for %s", image_path)
+            started.append((cache_key, cached, None, None))
+
+        # Several callers (or items) asking about the same frame share one round trip
+        calls = []
+        sending: Dict[tuple, int] = {}  # cache_key -> its call's position in calls
+        with self._inflight_lock:
+            for index, entry in enumerate(started):
+                if entry is None or entry[1] is not None:
+                    continue
+                cache_key = entry[0]
+                inflight = self._inflight.get(cache_key)
+                if inflight is not None:
+                    log.debug("Joining in-flight analysis for %s", items[index][0])
+                    started[index] = (cache_key, None) + inflight
+                    continue
+                if cache_key not in sending:
+                    log.debug("Sending MCP request: %s image_source=%s", MCP_VISION_TOOL, items[index][0])
+                    sending[cache_key] = len(calls)
+                    calls.append(("tools/call", _vision_call_params(items[index][0], cache_key[1])))
+
+            if calls:
+                # Send requests to MCP server; the reader thread resolves each future by id
+                sent = self._call_batch(calls)
+                for cache_key, position in sending.items():
+                    self._inflight[cache_key] = sent[position]
+                for index, entry in enumerate(started):
+                    if entry is not None and entry[1] is None and entry[3] is None:
+                        started[index] = (entry[0], None) + sent[sending[entry[0]]]
+
+        for cache_key, position in sending.items():
+            sent[position][1].add_done_callback(lambda done, key=cache_key: self._clear_inflight(key, done))
+        return started
+
+    def _clear_inflight(self, cache_key: tuple, future: concurrent.futures.Future):
+        """Done-callback: stop routing callers to a finished request, unless the key was already reused"""
+        with self._inflight_lock:
+            inflight = self._inflight.get(cache_key)
+            if inflight is not None and inflight[1] is future:
+                del self._inflight[cache_key]
+
+    def _finish_analysis(self, cache_key: tuple, response_data: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Shared back half: report a missing response, parse and cache the analysis"""
+        tool_name = MCP_VISION_TOOL
+        if response_data is None:
+            log.error(f"No response from MCP server for {tool_name}")
+            # Check if server is still running
+            if self.mcp_process is not None and self.mcp_process.poll() is not None:
+                log.error(f"MCP server process has terminated with code: {self.mcp_process.returncode}")
+                # Show the stderr captured so far to see what went wrong
+                log.error(f"MCP server stderr: {self._stderr_output()}")
+            return None
 
-            # Send list tools request
-            list_tools_json = json.dumps(list_tools_request) + '\n'
-            self.mcp_process.stdin.write(list_tools_json.encode())
-            self.mcp_process.stdin.flush()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Raw MCP response for %s: %s", tool_name, orjson.dumps(response_data, option=orjson.OPT_INDENT_2).decode())
 
-            # Read tools list response
-            import time
-            import select
+        analysis = self._parse_analysis(response_data, tool_name)
+        if is_vision_analysis(analysis) and self._is_text_result(response_data):
+            self._cache.put(cache_key, analysis)
+        return analysis
 
-            if hasattr(select, 'select'):
-                ready, _, _ = select.select([self.mcp_process.stdout], [], [], 10.0)
-                if not ready:
-                    log.error("Timeout waiting for tools list")
-                    return None
+    @staticmethod
+    def _is_text_result(response_data: Dict[str, Any]) -> bool:
+        """True for a successful tools/call result in MCP text content form (not isError or a str() fallback)"""
+        result = response_data.get('result')
+        if not isinstance(result, dict) or result.get('isError'):
+            return False
+        content = result.get('content')
+        return isinstance(content, list) and bool(content) and isinstance(content[0], dict) and 'text' in content[0]
 
-            tools_response = self.mcp_process.stdout.readline()
-            if tools_response:
-                tools_data = json.loads(tools_response.decode())
-                log.info(f"Available tools: {json.dumps(tools_data, indent=2)}")
+    async def analyze_images(self, items: List[tuple]) -> List[Optional[str]]:
+        """
+        Analyze several images, sending all their requests in one pipelined write
 
-                if 'result' in tools_data and 'tools' in tools_data['result']:
-                    available_tools = tools_data['result']['tools']
-                    log.info(f"Found {len(available_tools)} available tools")
-                    for tool in available_tools:
-                        log.info(f"Tool: {tool.get('name', 'unknown')} - {tool.get('description', 'no description')}")
-            else:
-                log.error("No response for tools list")
-
-            # Use the correct tool name and parameters from the schema
-            tool_name = "analyze_image"
-            log.info(f"Using tool: {tool_name}")
-
-            # Create MCP request for image analysis with correct schema
-            mcp_request = {
-                "jsonrpc": "2.0",
-                "id": 2,
-                "method": "tools/call",
-                "params": {
-                    "name": tool_name,
-                    "arguments": {
-                        "image_source": image_path,  # Use correct parameter name from schema
-                        "prompt": prompt
-                    }
-                }
-            }
+        Args:
+            items: List of (image_path, prompt) tuples
 
-            log.info(f"Sending MCP request: {json.dumps(mcp_request, indent=2)}")
+        Returns:
+            Analysis results in the same order as items (None for each failure)
+        """
+        if not self.is_connected:
+            log.error("MCP server not connected")
+            return [None] * len(items)
 
-            # Send request to MCP server
-            request_json = json.dumps(mcp_request) + '\n'
-            self.mcp_process.stdin.write(request_json.encode())
-            self.mcp_process.stdin.flush()
+        try:
+            started = self._start_analyses(items)
+        except Exception as e:
+            log.error(f"Failed to send batch image analysis: {e}", exc_info=True)
+            return [None] * len(items)
 
-                # Read response with timeout using sync approach since process was started with Popen
+        async def finish(entry: Optional[tuple]) -> Optional[str]:
+            if entry is None:
+                return None
+            cache_key, cached, request_id, future = entry
+            if cached is not None:
+                return cached
             try:
-                log.info(f"Waiting for MCP server response for {tool_name}...")
-
-                # Use select for timeout on subprocess stdout
-                if hasattr(select, 'select'):
-                    ready, _, _ = select.select([self.mcp_process.stdout], [], [], 30.0)
-                    if not ready:
-                        log.error(f"MCP server response timeout for {tool_name}")
-                        return None
-
-                response_line = self.mcp_process.stdout.readline()
-                if not response_line:
-                    log.error(f"No response from MCP server for {tool_name}")
-                    # Check if server is still running
-                    if self.mcp_process.poll() is not None:
-                        log.error(f"MCP server process has terminated with code: {self.mcp_process.returncode}")
-                        # Read stderr to see what went wrong
-                        if self.mcp_process.stderr:
-                            stderr_output = self.mcp_process.stderr.read().decode()
-                            log.error(f"MCP server stderr: {stderr_output}")
-                    return None
-
-                log.info(f"Raw MCP response for {tool_name}: {response_line.decode().strip()}")
-                response_data = json.loads(response_line.decode())
-            except Exception as read_error:
-                log.error(f"MCP server communication error for {tool_name}: {read_error}")
+                response_data = await self._await_response(request_id, future, MCP_VISION_TOOL)
+                return self._finish_analysis(cache_key, response_data)
+            except Exception as e:
+                log.error(f"Failed to analyze image: {e}", exc_info=True)
                 return None
 
-            if 'result' in response_data:
-                result = response_data['result']
-                # Handle different response formats
-                if isinstance(result, dict):
-                    # Check for MCP content format first
-                    if 'content' in result and isinstance(result['content'], list) and len(result['content']) > 0:
-                        content = result['content'][0]
-                        if isinstance(content, dict) and 'text' in content:
-                            analysis = content['text']
-                            log.info(f"Successfully parsed MCP content format: {len(analysis)} chars")
-                        else:
-                            analysis = str(content)
-                            log.warning(f"MCP content format unexpected, got: {type(content)}")
-                    elif 'tools' in result:
-                        # This is an INVALID response - MCP server returned tools list instead of analysis
-                        log.error(f"MCP server returned tools list instead of analysis. This indicates a server error. Response: {result}")
-                        return None
+        # Each response gets its own 30s window, all waited on together
+        return list(await asyncio.gather(*(finish(entry) for entry in started)))
+
+    async def _await_response(self, request_id: int, future: concurrent.futures.Future, tool_name: str,
+                              timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+        """Wait for the reader thread to resolve a request; None on timeout or server exit"""
+        try:
+            async with async_timeout(timeout):
+                # Shielded: the future may be shared with other waiters on the same frame
+                return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.TimeoutError:
+            self._forget(request_id, future)
+            log.error(f"MCP server response timeout for {tool_name} (id {request_id})")
+            return None
+
+    def _parse_analysis(self, response_data: Dict[str, Any], tool_name: str) -> Optional[str]:
+        """Extract the analysis text from a tools/call response, or None if it is unusable"""
+        if 'result' in response_data:
+            result = response_data['result']
+            # Handle different response formats
+            if isinstance(result, dict):
+                # Check for MCP content format first
+                if 'content' in result and isinstance(result['content'], list) and len(result['content']) > 0:
+                    content = result['content'][0]
+                    if isinstance(content, dict) and 'text' in content:
+                        analysis = content['text']
+                        log.debug("Successfully parsed MCP content format: %d chars", len(analysis))
                     else:
-                        # Fallback to other possible formats
-                        analysis = result.get('description', result.get('analysis', str(result)))
-                        log.info(f"Using fallback format for MCP response: {len(str(analysis))} chars")
-                elif isinstance(result, str):
-                    analysis = result
+                        analysis = str(content)
+                        log.warning(f"MCP content format unexpected, got: {type(content)}")
+                elif 'tools' in result:
+                    # This is an INVALID response - MCP server returned tools list instead of analysis
+                    log.error(f"MCP server returned tools list instead of analysis. This indicates a server error. Response: {result}")
+                    return None
                 else:
-                    analysis = str(result)
-
-                # Additional validation: ensure analysis is not just tool descriptions
-                if analysis and isinstance(analysis, str):
-                    # Check if the analysis contains tool-like content instead of actual image analysis
-                    tool_keywords = ['analyze_image', 'analyze_video', 'inputSchema', 'maximum file size', 'supports both local files and remote URL']
-                    if any(keyword.lower() in analysis.lower() for keyword in tool_keywords):
-                        log.error(f"Analysis appears to contain tool descriptions instead of actual image analysis. Treating as invalid. Analysis preview: {analysis[:200]}...")
-                        return None
-
-                log.info(f"Successfully got analysis from {tool_name}")
-                return analysis
-            elif 'error' in response_data:
-                log.error(f"MCP server error for {tool_name}: {response_data['error']}")
-                return None
+                    # Fallback to other possible formats
+                    analysis = result.get('description', result.get('analysis', str(result)))
+                    log.debug("Using fallback format for MCP response: %d chars", len(str(analysis)))
+            elif isinstance(result, str):
+                analysis = result
             else:
-                log.error(f"Unexpected MCP response for {tool_name}: {response_data}")
-                return None
-
-        except Exception as e:
-            log.error(f"Failed to analyze image: {e}", exc_info=True)
-            return None
+                analysis = str(result)
 
-    async def __aenter__(self):
-        """Async context manager entry"""
-        await self.start_mcp_server()
-        return self
+            # Additional validation: ensure analysis is not just tool descriptions
+            if analysis and isinstance(analysis, str):
+                # Check if the analysis contains tool-like content instead of actual image analysis
+                if _TOOL_KEYWORD_RE.search(analysis):
+                    log.error(f"Analysis appears to contain tool descriptions instead of actual image analysis. Treating as invalid. Analysis preview: {analysis[:200]}...")
+                    return None
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        """Async context manager exit"""
-        await self.stop_mcp_server()
+            log.debug("Successfully got analysis from %s", tool_name)
+            return analysis
+        elif 'error' in response_data:
+            log.error(f"MCP server error for {tool_name}: {response_data['error']}")
+            return None
+        else:
+            log.error(f"Unexpected MCP response for {tool_name}: {response_data}")
+            return None
 
 class ZAIVisionFallback:
     """
     Fallback vision handler that uses Z.AI's direct API when MCP is not available
     """
 
+    __slots__ = ('client', 'model', '_cache', '_url_cache', '_http')
+
     def __init__(self, client, model: str):
         """
         Initialize fallback vision handler
@@ -355,6 +730,79 @@ class ZAIVisionFallback:
             log.warning("No ZAI_API_KEY found, using provided client for vision fallback")
         self.model = model
 
+        # One pooled client for the whole run so every frame reuses the keep-alive connection
+        import httpx
+        self._cache = _LRUCache()
+        self._url_cache = _LRUCache(DATA_URL_CACHE_SIZE)
+        self._http = httpx.Client(
+            base_url="https://api.z.ai/api/coding/paas/v4",
+            timeout=30.0,
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8)
+        )
+
+    def close(self):
+        """Close the pooled HTTP connection"""
+        self._http.close()
+
+    def __del__(self):
+        http = getattr(self, '_http', None)
+        if http is not None:
+            http.close()
+
+    def _build_request(self, image_path: str, prompt: str) -> Dict[str, Any]:
+        """Build the chat completions body for one image + prompt"""
+        # Read and encode image; retries of an unchanged file reuse the encoded URL
+        st = os.stat(image_path)
+        url_key = (image_path, st.st_mtime_ns, st.st_size)
+        image_url = self._url_cache.get(url_key)
+        if image_url is None:
+            image_url = _image_data_url(image_path, max_side=FALLBACK_MAX_SIDE)
+            self._url_cache.put(url_key, image_url)
+
+        # Create message with image
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url,
+                            "detail": "low"
+                        }
+                    }
+                ]
+            }
+        ]
+
+        # Use raw HTTP request for coding plan API compatibility
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 1000,
+            "temperature": 0.7
+        }
+
+    @staticmethod
+    def _parse_response(response) -> Optional[str]:
+        """Pull the message content out of a chat completions HTTP response"""
+        if response.status_code == 200:
+            response_data = response.json()
+            if 'choices' in response_data and response_data['choices']:
+                return response_data['choices'][0]['message']['content']
+            else:
+                log.error(f"Vision API response missing choices: {response_data}")
+                return None
+        else:
+            log.error(f"Vision API HTTP request failed: {response.status_code}")
+            log.error(f"Vision API response: {response.text}")
+            return None
+
     def analyze_image(self, image_path: str, prompt: str = "What does this image show?") -> Optional[str]:
         """
         Analyze image using direct API calls
@@ -367,65 +815,22 @@ class ZAIVisionFallback:
             Analysis result or None if failed
         """
         try:
-            # Read and encode image
-            import base64
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-
-            # Create message with image
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_data}",
-                                "detail": "low"
-                            }
-                        }
-                    ]
-                }
-            ]
-
-            # Use raw HTTP request for coding plan API compatibility
-            import httpx
-
-            api_data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
-
-            headers = {
-                "Authorization": f"Bearer {os.getenv('ZAI_API_KEY')}",
-                "Content-Type": "application/json"
-            }
-
-            with httpx.Client(timeout=30.0) as http_client:
-                response = http_client.post(
-                    "https://api.z.ai/api/coding/paas/v4/chat/completions",
-                    json=api_data,
-                    headers=headers
-                )
-
-                if response.status_code == 200:
-                    response_data = response.json()
-                    if 'choices' in response_data and response_data['choices']:
-                        return response_data['choices'][0]['message']['content']
-                    else:
-                        log.error(f"Vision API response missing choices: {response_data}")
-                        return None
-                else:
-                    log.error(f"Vision API HTTP request failed: {response.status_code}")
-                    log.error(f"Vision API response: {response.text}")
-                    return None
-
+            # Screenshot checks run first, so _build_request only sees a non-empty file
+            digest = _screenshot_digest(image_path)
+            if digest is None:
+                return None
+            cache_key = (digest, prompt)
+            analysis = self._cache.get(cache_key)
+            if analysis is None:
+                response = self._http.post("/chat/completions", content=orjson.dumps(self._build_request(image_path, prompt)))
+                analysis = self._parse_response(response)
+                if is_vision_analysis(analysis):
+                    self._cache.put(cache_key, analysis)
+            return analysis
+
+        except FileNotFoundError:
+            log.error(f"Image file not found: {image_path}")
+            return None
         except Exception as e:
             log.error(f"Fallback image analysis failed: {e}", exc_info=True)
             return None
@@ -445,8 +850,21 @@ def create_zai_vision_client(client, model: str, use_mcp: bool = True) -> Any:
     if use_mcp:
         api_key = os.getenv("ZAI_API_KEY")
         if api_key:
+            key = (api_key, "ZAI")
+            mcp_client = _mcp_clients.get(key)
+            if mcp_client is not None and mcp_client.is_connected:
+                log.info("Reusing running Z.AI MCP vision client")
+                return mcp_client
+            if mcp_client is not None:
+                # Stale entry: reuse the instance but bring its server back up
+                log.info("Restarting Z.AI MCP vision server")
+                mcp_client._start_mcp_server_sync()
+                return mcp_client
             log.info("Creating Z.AI MCP vision client")
-            return ZAIMCPClient(api_key=api_key)
+            mcp_client = ZAIMCPClient(api_key=api_key)
+            _mcp_clients[key] = mcp_client
+            atexit.register(mcp_client.stop_mcp_server_sync)
+            return mcp_client
         else:
             log.warning("ZAI_API_KEY not found, falling back to direct API")
 
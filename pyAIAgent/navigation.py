@@ -1,17 +1,11 @@
-import os
-from collections import deque
-from pyAIAgent.game.rom import load_map, load_tileset_header, load_collision_data, load_block_data
-from pyAIAgent.game.graphics import build_quadrant_walkability
+import sys
+import logging
+from array import array
+from functools import lru_cache
+from pyAIAgent.game.rom import load_rom, load_map, load_tileset_header, load_collision_data, load_block_data_cached, get_rom_path
+from pyAIAgent.game.graphics import build_walkability_buffer
 
-DEFAULT_ROM = 'red.gb'
-
-def get_rom_path():
-    """Get ROM path from environment variable or default, relative to roms folder"""
-    rom_name = os.getenv('POKEMON_ROM', DEFAULT_ROM)
-    # If ROM path doesn't include a directory, assume it's in roms folder
-    if os.path.sep not in rom_name and not os.path.isabs(rom_name):
-        return os.path.join('roms', rom_name)
-    return rom_name
+log = logging.getLogger('navigation')
 
 def touch_controls_path_find(mapid, currentPos, screenCoords):
     """
@@ -20,69 +14,167 @@ def touch_controls_path_find(mapid, currentPos, screenCoords):
     """
     x = int(screenCoords[0]) - 4
     y = int(screenCoords[1]) - 4
-    print(f"POS: {int(currentPos[0])},{int(currentPos[1])}, Translated: {x},{y}, Desination: {int(currentPos[0]) + x},{int(currentPos[1]) + y}")
+    log.debug("POS: %d,%d, Translated: %d,%d, Destination: %d,%d",
+              int(currentPos[0]), int(currentPos[1]), x, y, int(currentPos[0]) + x, int(currentPos[1]) + y)
     destination = [max(int(currentPos[0]) + x, 0), max(int(currentPos[1]) + y, 0)]
     actions = find_path(get_rom_path(), mapid, currentPos, destination)
     if actions is None:
         return "[PATH BLOCKED OR INVALID UNWALKABLE DESTINATION]\n"
     return actions # None if there is no valid path
 
+# Action letters for a step to the R, L, D and U neighbour. The backward search
+# records the move from the neighbour back towards the end, i.e. the opposite.
+_FWD_ACTIONS = (82, 76, 68, 85)   # R L D U
+_BWD_ACTIONS = (76, 82, 85, 68)   # L R U D
+
+def _pad_walkable(walkable, rows, cols):
+    """
+    Surround a flat rows x cols walkability buffer with a one-cell blocked
+    border, so every in-map cell has four in-range neighbours and the search
+    needs no bounds checks. Cell (x, y) lands at (y + 1) * (cols + 2) + x + 1.
+    """
+    pcols = cols + 2
+    padded = bytearray(pcols * (rows + 2))
+    for y in range(rows):
+        start = (y + 1) * pcols + 1
+        padded[start:start + cols] = walkable[y * cols:(y + 1) * cols]
+    return padded
+
+def _bfs_layer(walkable, frontier, depth, prev, action, dist, other_dist, moves):
+    """
+    Expand one full BFS layer (all cells at `depth`) on one side of the search.
+    Returns the next frontier and the best (total length, cell) where it met the
+    other side, or None.
+    """
+    nxt = []
+    push = nxt.append
+    best = None
+    d = depth + 1
+    for i in frontier:
+        for step, letter in moves:
+            n = i + step
+            if not walkable[n] or dist[n] >= 0:
+                continue
+            dist[n] = d
+            prev[n] = i
+            action[n] = letter
+            push(n)
+            if other_dist[n] >= 0:
+                total = d + other_dist[n]
+                if best is None or total < best[0]:
+                    best = (total, n)
+    return nxt, best
+
+def _bfs_core(walkable, pcols, s, e):
+    """
+    Bidirectional breadth-first search over a padded flat walkability buffer
+    (see _pad_walkable) with rows of pcols cells. Grows whichever frontier is
+    smaller one full layer at a time. Returns (prev_idx, prev_action) arrays
+    whose chain from e back to s is a shortest path, or None if e is
+    unreachable from s.
+    """
+    size = len(walkable)
+    prev_idx = array('i', [-1]) * size
+    prev_action = bytearray(size)
+    prev_idx[s] = s
+    if s == e:
+        return prev_idx, prev_action
+
+    # Backward tree: next_idx[n] is the next cell from n towards e.
+    next_idx = array('i', [-1]) * size
+    next_action = bytearray(size)
+    dist_f = array('i', [-1]) * size
+    dist_b = array('i', [-1]) * size
+    dist_f[s] = dist_b[e] = 0
+    steps = (1, -1, pcols, -pcols)
+    fwd_moves = tuple(zip(steps, _FWD_ACTIONS))
+    bwd_moves = tuple(zip(steps, _BWD_ACTIONS))
+
+    fwd, bwd = [s], [e]
+    depth_f = depth_b = 0
+    while fwd and bwd:
+        if len(fwd) <= len(bwd):
+            fwd, met = _bfs_layer(walkable, fwd, depth_f, prev_idx, prev_action,
+                                  dist_f, dist_b, fwd_moves)
+            depth_f += 1
+        else:
+            bwd, met = _bfs_layer(walkable, bwd, depth_b, next_idx, next_action,
+                                  dist_b, dist_f, bwd_moves)
+            depth_b += 1
+        if met is None:
+            continue
+        # Splice the backward half onto the forward tree so the chain from e
+        # leads back through the meeting cell to s.
+        curr = met[1]
+        while curr != e:
+            n = next_idx[curr]
+            prev_idx[n] = curr
+            prev_action[n] = next_action[curr]
+            curr = n
+        return prev_idx, prev_action
+    return None
+
 def _bfs_find_path(grid, start, end):
     if not grid or not grid[0]:
         return None
     rows, cols = len(grid), len(grid[0])
+    walkable = bytearray(cols * rows)
+    for y, row in enumerate(grid):
+        walkable[y * cols:(y + 1) * cols] = bytes(map(bool, row))
+    return _bfs_flat(_pad_walkable(walkable, rows, cols), rows, cols, start, end)
+
+def _bfs_flat(walkable, rows, cols, start, end):
+    """Path search on a padded walkability buffer (see _pad_walkable) for a rows x cols map."""
     sx, sy = start
     ex, ey = end
     def oob(x, y):
         return not (0 <= x < cols and 0 <= y < rows)
     if oob(sx, sy):
-        print(f"Error: Start {start} OOB ({cols}x{rows})", file=sys.stderr)
+        log.debug("Start %s OOB (%dx%d)", start, cols, rows)
         return None
     if oob(ex, ey):
-        print(f"Error: End {end} OOB ({cols}x{rows})", file=sys.stderr)
+        log.debug("End %s OOB (%dx%d)", end, cols, rows)
         return None
-    if not grid[sy][sx]:
-        print(f"Warning: Start {start} blocked.", file=sys.stderr)
-    if not grid[ey][ex]:
-        print(f"Warning: End {end} blocked.", file=sys.stderr)
+    pcols = cols + 2
+    s, e = (sy + 1) * pcols + sx + 1, (ey + 1) * pcols + ex + 1
+    if not walkable[s]:
+        log.debug("Start %s blocked.", start)
+    if not walkable[e]:
+        log.debug("End %s blocked.", end)
         return None
 
-    queue = deque([(sx, sy)])
-    prev = {(sx, sy): None}
-    dirs = [(1, 0, 'R'), (-1, 0, 'L'), (0, 1, 'D'), (0, -1, 'U')]
-
-    while queue:
-        x, y = queue.popleft()
-        if (x, y) == (ex, ey):
-            break
-        for dx, dy, action in dirs:
-            nx, ny = x + dx, y + dy
-            if not oob(nx, ny) and grid[ny][nx] and (nx, ny) not in prev:
-                prev[(nx, ny)] = (x, y, action)
-                queue.append((nx, ny))
-    else:
+    found = _bfs_core(walkable, pcols, s, e)
+    if found is None:
         return None
+    prev_idx, prev_action = found
 
-    actions, coords = [], []
-    curr = (ex, ey)
-    while prev[curr] is not None:
-        coords.append(curr)
-        px, py, action = prev[curr]
-        actions.append(action)
-        curr = (px, py)
+    actions, coords = bytearray(), []
+    curr = e
+    while curr != s:
+        coords.append((curr % pcols - 1, curr // pcols - 1))
+        actions.append(prev_action[curr])
+        curr = prev_idx[curr]
     coords.append(start)
-    return ''.join(reversed(actions)), list(reversed(coords))
+    actions.reverse()
+    return actions.decode('ascii'), list(reversed(coords))
+
+@lru_cache(maxsize=64)
+def _walkability(rom_path, map_id):
+    """Padded walkability buffer for a map as (walkable, rows, cols); fixed for a given ROM."""
+    rom = load_rom(rom_path)
+    tileset_id, width, height, map_data = load_map(rom, map_id)
+    bank, blocks_ptr, _, collision_ptr, _ = load_tileset_header(rom, tileset_id)
+    walkable_tiles = load_collision_data(rom, collision_ptr, bank)
+    blocks = load_block_data_cached(rom_path, rom, blocks_ptr, bank, map_data)
+    rows, cols = height * 2, width * 2
+    walkable = build_walkability_buffer(width, height, map_data, blocks, walkable_tiles)
+    return bytes(_pad_walkable(walkable, rows, cols)), rows, cols
 
 def find_path(rom_path, map_id, start, end):
     """Finds shortest path actions string between two points."""
     try:
-        rom = open(rom_path, 'rb').read()
-        tileset_id, width, height, map_data = load_map(rom, map_id)
-        bank, blocks_ptr, _, collision_ptr, _ = load_tileset_header(rom, tileset_id)
-        walkable_tiles = load_collision_data(rom, collision_ptr, bank)
-        blocks = load_block_data(rom, blocks_ptr, bank, map_data)
-        grid = build_quadrant_walkability(width, height, map_data, blocks, walkable_tiles)
-        result = _bfs_find_path(grid, start, end)
+        walkable, rows, cols = _walkability(rom_path, map_id)
+        result = _bfs_flat(walkable, rows, cols, start, end) if cols else None
         return (';'.join(result[0]) + ';') if result else None
     except (FileNotFoundError, IOError) as e:
         print(f"Error reading ROM '{rom_path}': {e}", file=sys.stderr)
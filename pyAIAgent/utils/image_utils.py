@@ -15,30 +15,51 @@ SIZE_MAP = {
     GB_RASTER_SIZE: (GB_WIDTH, GB_HEIGHT),
 }
 
+# Big-endian length prefix on CAP responses
+_U32_BE = struct.Struct(">I")
+
+# Scratch buffer every CAP response (4-byte length + raster) is received into.
+# Captures are strictly sequential on the mGBA socket and PIL decodes (copies)
+# the ARGB raster out of it, so one buffer sized for the largest raster serves
+# every call.
+_CAP_BUF = bytearray(4 + max(SIZE_MAP))
+
 def capture(sock, filename: str = "latest.png", cell_size: int = 16) -> None:
-    from pyAIAgent.utils.socket_utils import _flush_socket
+    from pyAIAgent.utils.socket_utils import _flush_socket, CMD_CAP
     # flush any leftover bytes
     _flush_socket(sock)
 
-    sock.sendall(b"CAP\n")
-    hdr = sock.recv(4)
-    if len(hdr) < 4:
-        raise RuntimeError("socket closed during CAP header")
-    length = struct.unpack(">I", hdr)[0]
+    sock.sendall(CMD_CAP)
+
+    # header and raster usually arrive together, so receive both in one go
+    buf = _CAP_BUF
+    view = memoryview(buf)
+    got = 0
+    while got < 4:
+        n = sock.recv_into(view[got:])
+        if not n:
+            raise RuntimeError("socket closed during CAP header")
+        got += n
+    length = _U32_BE.unpack_from(buf, 0)[0]
 
-    data = bytearray()
-    while len(data) < length:
-        chunk = sock.recv(length - len(data))
-        if not chunk:
+    end = 4 + length
+    if end > len(buf):
+        buf = bytearray(end)
+        buf[:got] = view[:got]
+        view = memoryview(buf)
+    view = view[:end]
+    while got < end:
+        n = sock.recv_into(view[got:])
+        if not n:
             raise RuntimeError("socket closed mid-image")
-        data.extend(chunk)
+        got += n
 
     size = SIZE_MAP.get(length)
     if size is None:
         raise RuntimeError(f"unexpected raster size {length} bytes")
 
-    # build image from raw data
-    img = Image.frombytes("RGBA", size, bytes(data), "raw", "ARGB")
+    # build image from raw data (decoded directly from the receive buffer)
+    img = Image.frombuffer("RGBA", size, view[4:], "raw", "ARGB", 0, 1)
 
     # draw the 16×16 grid
     draw = ImageDraw.Draw(img)
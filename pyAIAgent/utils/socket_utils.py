@@ -1,10 +1,31 @@
+import socket
 import struct
 
+# Fixed mGBA script commands, pre-encoded with their line terminator
+CMD_CAP = b"CAP\n"
+CMD_QUIT = b"quit\n"
+CMD_LOADSTATE_1 = b"LOADSTATE 1\n"
+CMD_INPUT_DISPLAY_ON = b"INPUT_DISPLAY_ON\n"
+
+# Non-blocking recv flag, where the platform has one (not on Windows)
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
 def _flush_socket(sock) -> None:
     """
     Drain any pending data from sock so that our next recv()
     only sees the fresh response to the command we send.
     """
+    if _MSG_DONTWAIT:
+        # Per-call non-blocking recv: a clean socket costs a single syscall
+        # instead of toggling the socket's blocking mode around it
+        try:
+            while sock.recv(4096, _MSG_DONTWAIT):
+                pass
+        except (BlockingIOError, OSError):
+            # No more data to read
+            pass
+        return
+
     # Switch to non-blocking so recv() returns immediately if no data
     sock.setblocking(False)
     try:
@@ -36,9 +57,10 @@ def readrange(sock, address: str, length: str) -> bytes:
     return bytes(data)
 
 
-def send_command(sock, cmd: str) -> str:
+def send_command(sock, cmd: str | bytes) -> str:
+    """Send one command line and return the one-line reply. bytes are sent as-is (e.g. the CMD_* constants)."""
     _flush_socket(sock)
-    sock.sendall((cmd.strip() + "\n").encode('utf-8'))
+    sock.sendall(cmd if isinstance(cmd, bytes) else (cmd.strip() + "\n").encode('utf-8'))
     data = bytearray()
     while True:
         chunk = sock.recv(4096)
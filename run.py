@@ -1,24 +1,33 @@
 import argparse
 import subprocess
 import socket
+import select
 import time
 import os
 import sys
+import signal
 import asyncio
 import logging
 
 from pyAIAgent.utils.misc import parse_max_loops_fn
-from pyAIAgent.utils.socket_utils import send_command
-from pyAIAgent.game.state import DEFAULT_ROM, get_rom_path
-from websocket_service import broadcast_message, run_server_forever as start_websocket_service
-from benchmark import load
-from interactive import interactive_console
-from llmdriver import run_auto_loop, MODEL
+from pyAIAgent.utils.socket_utils import send_command, _flush_socket, CMD_QUIT, CMD_LOADSTATE_1, CMD_INPUT_DISPLAY_ON
+from pyAIAgent.game.rom import get_rom_path
 
 # --- Configuration (excluding WebSocket specific) ---
 import config
 
+# mGBA script server connect polling: backoff from 50ms up to 250ms, 10s in total.
+# A refused localhost connect fails immediately, so polling this often is cheap.
+MGBA_CONNECT_TIMEOUT = 10.0
+MGBA_CONNECT_BASE_DELAY = 0.05
+MGBA_CONNECT_MAX_DELAY = 0.25
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(name)s: %(message)s')
+# None of our formats use caller, thread or process fields, so don't collect them per record
+logging._srcfile = None
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
 log = logging.getLogger("main")
 
 
@@ -30,7 +39,7 @@ state = {
     "goals": { "primary": 'Initializing...', "secondary": 'Initializing...', "tertiary": 'Initializing...' },
     "otherGoals": 'Initializing...',
     "currentTeam": [],
-    "modelName": MODEL,
+    "modelName": None, # Filled in by llmdriver once the mode is selected
     "tokensUsed": 0,
     "ggValue": 0,
     "summaryValue": 0,
@@ -43,64 +52,65 @@ def start_mgba_with_scripting(rom_path=None, port=config.PORT):
     if not os.path.exists(rom_path):
         log.error(f"ROM file not found: {rom_path}")
         sys.exit(1)
-    if not os.path.exists(config.MGBA_EXE):
-         log.error(f"mGBA executable not found: {config.MGBA_EXE}")
-         sys.exit(1)
     if not os.path.exists(config.LUA_SCRIPT):
         log.error(f"Lua script not found: {config.LUA_SCRIPT}")
         sys.exit(1)
 
-    cmd = [config.MGBA_EXE, '--script', config.LUA_SCRIPT, rom_path]
+    # Absolute executable path and close_fds=False let Popen use posix_spawn
+    # instead of fork+exec on POSIX, so the (large, post-import) parent isn't
+    # duplicated. Our own fds are non-inheritable by default, so nothing leaks.
+    cmd = [os.path.abspath(config.MGBA_EXE), '--script', config.LUA_SCRIPT, rom_path]
     log.info(f"Starting mGBA: {' '.join(cmd)}")
     try:
         # Redirect stdout to DEVNULL, capture stderr
-        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, close_fds=False)
     except FileNotFoundError:
+        # Popen reports a missing executable itself, so there is no separate preflight check for it
+        log.error(f"mGBA executable not found: {config.MGBA_EXE}")
         log.error(f"Failed to start mGBA. Ensure '{config.MGBA_EXE}' is correct and executable.")
         sys.exit(1)
     except Exception as e:
         log.error(f"Error starting mGBA: {e}", exc_info=True)
         sys.exit(1)
 
-    # Wait a bit for mGBA and Lua script to initialize the socket server
-    time.sleep(3) # Might need adjustment based on system speed
-
-    # Check if mGBA exited prematurely
-    if proc.poll() is not None:
-        stderr_output = proc.stderr.read() # Read captured stderr
-        log.error(f"mGBA process terminated unexpectedly shortly after start. Exit code: {proc.returncode}")
-        if stderr_output:
-            log.error(f"mGBA stderr:\n{stderr_output.strip()}")
-        else:
-            log.error("mGBA stderr is empty.")
-        sys.exit(1)
-
-    # Attempt to connect to the mGBA socket
+    # Poll for the Lua script's socket server instead of sleeping a fixed time:
+    # retry refused connections with a short, growing backoff until the deadline
     sock = None
-    retries = 5
-    for attempt in range(retries):
+    deadline = time.monotonic() + MGBA_CONNECT_TIMEOUT
+    attempt = 0
+    while True:
+        # Check if mGBA exited prematurely
+        if proc.poll() is not None:
+            stderr_output = proc.stderr.read() # Read captured stderr
+            log.error(f"mGBA process terminated unexpectedly shortly after start. Exit code: {proc.returncode}")
+            if stderr_output:
+                log.error(f"mGBA stderr:\n{stderr_output.strip()}")
+            else:
+                log.error("mGBA stderr is empty.")
+            sys.exit(1)
+
+        attempt += 1
         try:
             # create_connection handles both IPv4/IPv6
             sock = socket.create_connection(('localhost', port), timeout=2)
             # Keep blocking for simplicity in current setup (console/llmdriver manage reads)
             sock.setblocking(True)
-            log.info(f"Connected to mGBA scripting server on port {port}")
+            # Room for a whole CAP frame in the kernel buffer, and no Nagle delay
+            # on the short request lines we send
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            log.info(f"Connected to mGBA scripting server on port {port} (attempt {attempt})")
+            # Blocking send_command is fine here: in auto mode this whole function
+            # runs in a worker thread, not on the event loop
             if(config.LOAD_SAVESTATE): # Check the global config.LOAD_SAVESTATE flag
                 log.info("config.LOAD_SAVESTATE is True, attempting to load savestate 1.")
-                send_command(sock, "LOADSTATE 1")
+                send_command(sock, CMD_LOADSTATE_1)
             return proc, sock # Success
         except ConnectionRefusedError:
-            log.warning(f"Connection to mGBA refused (attempt {attempt+1}/{retries}). Is mGBA running and script loaded?")
-            if proc.poll() is not None: # Check again if mGBA died while waiting
-                 stderr_output = proc.stderr.read()
-                 log.error(f"mGBA process terminated while attempting to connect. Exit code: {proc.returncode}")
-                 if stderr_output:
-                     log.error(f"mGBA stderr:\n{stderr_output.strip()}")
-                 sys.exit(1)
-            time.sleep(1.5) # Wait longer between retries
+            # Expected until the script has started listening
+            log.debug(f"Connection to mGBA refused (attempt {attempt}), retrying.")
         except socket.timeout:
-            log.warning(f"Connection to mGBA timed out (attempt {attempt+1}/{retries}).")
-            time.sleep(1)
+            log.warning(f"Connection to mGBA timed out (attempt {attempt}).")
         except Exception as e:
             # Catch other potential socket errors
             log.error(f"Unexpected error connecting to mGBA socket: {e}", exc_info=True)
@@ -109,8 +119,14 @@ def start_mgba_with_scripting(rom_path=None, port=config.PORT):
                 proc.wait()
             sys.exit(1)
 
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(MGBA_CONNECT_MAX_DELAY, MGBA_CONNECT_BASE_DELAY * 2 ** (attempt - 1), remaining))
+
     # If loop finishes without returning, connection failed
-    log.error(f"Failed to connect to mGBA scripting server at localhost:{port} after {retries} attempts.")
+    log.error(f"Failed to connect to mGBA scripting server at localhost:{port} after {attempt} attempts "
+              f"({MGBA_CONNECT_TIMEOUT:.0f}s). Is mGBA running and script loaded?")
     if proc and proc.poll() is None:
         log.info("Terminating mGBA process due to connection failure.")
         proc.terminate()
@@ -126,13 +142,16 @@ async def shutdown_socket(sock, is_async):
       try:
           log.info("Sending quit command to mGBA script...")
           try:
-              sock.sendall(b"quit\n")
-              
+              _flush_socket(sock)
+              sock.sendall(CMD_QUIT)
+
+              # Give the script up to 0.2s to process it, but stop waiting as
+              # soon as it answers (it replies to every line) or drops us
               if is_async:
-                await asyncio.sleep(0.2)
+                await asyncio.to_thread(select.select, [sock], [], [], 0.2)
               else:
-                time.sleep(0.2) 
-              
+                select.select([sock], [], [], 0.2)
+
           except OSError as send_err:
               log.warning(f"Could not send quit command to mGBA (socket likely closed): {send_err}")
           sock.close()
@@ -170,20 +189,37 @@ async def terminate_process(proc, is_async):
 async def main_async(auto, max_loops_arg=None, selected_mode=None): # Added max_loops_arg and selected_mode
     """Asynchronous main function to run mGBA, WebSocket server, and optionally the LLM loop."""
     proc = sock = None
+    mgba_startup = None
     websocket_task = None
     llm_task = None
     tasks_to_await = []
 
+    # Treat SIGTERM (systemd/docker stop) like Ctrl+C: cancel this task so the
+    # cleanup below still quits the mGBA script and terminates the emulator
     try:
-        # config.LOAD_SAVESTATE global will be used by start_mgba_with_scripting
-        proc, sock = start_mgba_with_scripting()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass # No loop signal handlers on Windows
 
+    try:
         if auto:
+            # Imported here so interactive runs and --help don't pay for the
+            # LLM SDKs and the WebSocket server
+            from websocket_service import broadcast_message, run_server_forever as start_websocket_service
+            from benchmark import load
+            from llmdriver import run_auto_loop
+
             log.info("Auto mode enabled. Starting WebSocket server and LLM driver.")
             # Start the WebSocket server (passing the shared 'state' dictionary)
             websocket_task = asyncio.create_task(start_websocket_service(state), name="WebSocketService")
             tasks_to_await.append(websocket_task)
 
+            # Boot mGBA in a worker thread so the WebSocket server comes up (and
+            # the loop stays responsive) while we wait for the script's socket.
+            # config.LOAD_SAVESTATE global will be used by start_mgba_with_scripting
+            mgba_startup = asyncio.ensure_future(asyncio.to_thread(start_mgba_with_scripting))
+            proc, sock = await asyncio.shield(mgba_startup)
+
             benchmark = None
             if config.benchmark_path is not None:
                 try:
@@ -196,7 +232,8 @@ async def main_async(auto, max_loops_arg=None, selected_mode=None): # Added max_
 
             # Start the LLM driver loop (passing the imported broadcast_message function)
             if max_loops_arg is not None:
-                send_command(sock, "INPUT_DISPLAY_ON")
+                # Blocking socket round trip; keep it off the event loop
+                await asyncio.to_thread(send_command, sock, CMD_INPUT_DISPLAY_ON)
                 log.info(f"Starting LLM driver loop (max_loops: {max_loops_arg})...")
                 llm_task = asyncio.create_task(
                     run_auto_loop(sock, state, broadcast_message, interval=13.0, max_loops=max_loops_arg, benchmark=benchmark),
@@ -245,19 +282,20 @@ async def main_async(auto, max_loops_arg=None, selected_mode=None): # Added max_
         log.error(f"An error occurred in main_async: {e}", exc_info=True)
     finally:
         log.info("Cleaning up async resources...")
+        # If we were interrupted while mGBA was still booting, let the startup
+        # finish so the emulator it launched is shut down below
+        if proc is None and mgba_startup is not None:
+            try:
+                proc, sock = await mgba_startup
+            except BaseException:
+                pass # startup failed and already exited/cleaned up after itself
         # Cancel tasks if they are still running (e.g., if main_async exits due to an error)
-        for task in tasks_to_await:
-             if task and not task.done():
-                 log.info(f"Cancelling task {task.get_name()} during final cleanup.")
-                 task.cancel()
-        
-        pending_cancellations = [t for t in tasks_to_await if t and t.cancelled()] 
-        for t in tasks_to_await: 
-            if t and not t.done() and t not in pending_cancellations: 
-                pending_cancellations.append(t)
-        
-        if pending_cancellations:
-            await asyncio.gather(*pending_cancellations, return_exceptions=True)
+        still_running = [t for t in tasks_to_await if t and not t.done()]
+        for task in still_running:
+            log.info(f"Cancelling task {task.get_name()} during final cleanup.")
+            task.cancel()
+        if still_running:
+            await asyncio.gather(*still_running, return_exceptions=True)
 
         await shutdown_socket(sock, is_async = True)
         await terminate_process(proc, is_async = True)
@@ -281,13 +319,10 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    # Select LLM mode first (before any mGBA startup)
-    from client_setup import parse_mode_arg, MODES
-    from llmdriver import set_current_mode
-    selected_mode = parse_mode_arg(MODES, default_mode="ZAI")
-
-    # Set the mode in llmdriver
-    set_current_mode(selected_mode)
+    # .env (e.g. POKEMON_ROM) must be loaded for interactive runs as well, which
+    # never import client_setup
+    from dotenv import load_dotenv
+    load_dotenv()
 
     # Set global config based on parsed arguments
     if args.load_savestate:
@@ -297,16 +332,37 @@ if __name__ == '__main__':
         config.benchmark_path = args.benchmark
 
     if args.auto:
+        # Select LLM mode first (before any mGBA startup)
+        from client_setup import parse_mode_arg, MODES
+        from llmdriver import set_current_mode
+        selected_mode = parse_mode_arg(MODES, default_mode="ZAI")
+
+        # Set the mode in llmdriver
+        set_current_mode(selected_mode)
+
+        # The Proactor loop busy-polls while idle on Windows; mGBA and the vision MCP server
+        # are driven through sockets and Popen pipes, not asyncio subprocesses, so the
+        # selector loop is sufficient
+        run_kwargs = {}
+        if sys.platform == "win32":
+            if sys.version_info >= (3, 12):
+                run_kwargs["loop_factory"] = asyncio.SelectorEventLoop
+            else:
+                asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
         try:
-            asyncio.run(main_async(auto=True, max_loops_arg=args.max_loops, selected_mode=selected_mode))
+            asyncio.run(main_async(auto=True, max_loops_arg=args.max_loops, selected_mode=selected_mode), **run_kwargs)
         except KeyboardInterrupt:
             log.info("KeyboardInterrupt received, stopping async tasks...")
+        except asyncio.CancelledError:
+            log.info("SIGTERM received, async tasks stopped.")
         except Exception as e:
             log.critical(f"Critical error in async execution: {e}", exc_info=True)
         finally:
             log.info("--- Async run finished ---")
     else:
         # --- Synchronous/Interactive Mode ---
+        from interactive import interactive_console
         log.info("Interactive mode enabled. WebSocket server and LLM driver will NOT run.")
         proc = sock = None
         try:
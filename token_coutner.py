@@ -1,4 +1,5 @@
 import logging
+from functools import lru_cache
 import tiktoken
 
 # https://platform.openai.com/docs/guides/images-vision
@@ -25,6 +26,16 @@ except Exception as e:
     encoding = None
 
 
+# Prompts repeat a lot between calls (system prompt, recent history), so token
+# counts are memoized; very long strings are counted directly to bound memory
+TOKEN_CACHE_MAX_CHARS = 64 * 1024
+
+
+@lru_cache(maxsize=512)
+def _encoded_len(text: str) -> int:
+    return len(encoding.encode(text))
+
+
 def count_tokens(text: str) -> int:
     """Estimates token count for a given text using the loaded encoding."""
     if not text:
@@ -32,6 +43,8 @@ def count_tokens(text: str) -> int:
     if not encoding:
         return len(text) // 4
     try:
+        if len(text) <= TOKEN_CACHE_MAX_CHARS:
+            return _encoded_len(text)
         return len(encoding.encode(text))
     except Exception as e:
         log.warning(f"Tiktoken encoding failed (len {len(text)}): {e}. Using fallback.")
@@ -1,11 +1,14 @@
 # --- websocket_service.py ---
 import asyncio
 import websockets
-import json
+import orjson
 import logging
 
 WEBSOCKET_PORT = 8765
 
+# orjson rejects non-str dict keys by default; stdlib json stringified them
+_JSON_OPTS = orjson.OPT_NON_STR_KEYS
+
 connected_clients = set()
 log = logging.getLogger("websocket_service")
 
@@ -14,36 +17,21 @@ async def broadcast_message(message):
     if not connected_clients:
         return
 
-    message_json = json.dumps(message)
-    # Use create_task for better concurrency handling if many clients exist
-    send_tasks = [asyncio.create_task(client.send(message_json)) for client in connected_clients]
-    if not send_tasks:
-        return
-
-    results = await asyncio.gather(*send_tasks, return_exceptions=True)
-
-    disconnected_clients = set()
-    clients_list = list(connected_clients) # Create stable list for indexing
-    for i, result in enumerate(results):
-        if isinstance(result, Exception):
-            # Ensure index is valid before accessing clients_list
-            if i < len(clients_list):
-                client = clients_list[i]
-                log.warning(f"WS: Failed to send to client {client.remote_address}: {result}. Removing.")
-                disconnected_clients.add(client)
-            else:
-                 # This case should theoretically not happen with gather but added defensively
-                 log.error(f"WS: Index {i} out of bounds for clients list of size {len(clients_list)} during error handling.")
-
-    connected_clients.difference_update(disconnected_clients)
+    # Decoded to str so clients still receive a text frame for JSON.parse
+    message_json = orjson.dumps(message, option=_JSON_OPTS).decode()
+    # Encodes the frame once and writes it to every open connection without
+    # awaiting each send; closed clients are skipped and removed by their
+    # handler's finally block
+    websockets.broadcast(connected_clients, message_json)
 
 
 async def _send_full_state(websocket, current_app_state):
     """Sends the complete current state to a newly connected client."""
     try:
-        # Ensure state is JSON serializable before sending
-        state_copy = json.loads(json.dumps(current_app_state)) # Simple deep copy via JSON
-        await websocket.send(json.dumps(state_copy))
+        # Serialize once up front: this both snapshots the state and fails with
+        # TypeError before sending if it isn't JSON serializable
+        state_json = orjson.dumps(current_app_state, option=_JSON_OPTS).decode()
+        await websocket.send(state_json)
         log.info(f"WS: Sent full initial state to {websocket.remote_address}")
     except websockets.exceptions.ConnectionClosed:
         log.warning(f"WS: Failed to send initial state to {websocket.remote_address}, client disconnected before send completed.")